@@ -0,0 +1,84 @@
+import os, threading, time
+from collections import defaultdict
+from sqlalchemy import func, Integer
+from sqlalchemy.orm import Session
+from app.models import Sala, VersaoSalas
+from app.database import UNIDADE_PADRAO
+
+class CacheSalas:
+    """
+    Dados estáticos das salas (bloco, andar, especialidade preferencial, features) por unidade.
+    Só mudam quando o CSV de salas é reimportado, então ficam em memória até invalidar().
+
+    invalidar() só vale para o processo atual. Para pegar mudanças feitas por outro worker
+    ou pela CLI, uma assinatura barata (versão em versao_salas, contagem, salas em manutenção,
+    menor e maior id) é conferida a cada `intervalo` segundos. Quem regrava as salas chama
+    marcar_alteracao() na mesma transação; edições avulsas aparecem no máximo após `ttl` segundos.
+    """
+
+    def __init__(self, ttl: float = None, intervalo: float = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("GDS_CACHE_SALAS_TTL", 300))
+        self.intervalo = intervalo if intervalo is not None else float(os.environ.get("GDS_CACHE_SALAS_INTERVALO", 5))
+        self._lock = threading.Lock()
+        self._por_unidade = {}
+
+    def _assinatura(self, db: Session, unidade: str):
+        versao = db.query(VersaoSalas.versao).filter(VersaoSalas.unidade == unidade).scalar_subquery()
+        return tuple(db.query(
+            versao, func.count(Sala.id), func.sum(func.coalesce(Sala.is_maintenance, False).cast(Integer)),
+            func.min(Sala.id), func.max(Sala.id)
+        ).filter(Sala.unidade == unidade).one())
+
+    def _carregar(self, db: Session, unidade: str):
+        linhas = db.query(
+            Sala.id, Sala.bloco, Sala.andar, Sala.especialidade_preferencial, Sala.features, Sala.is_maintenance
+        ).filter(Sala.unidade == unidade).all()
+
+        mapa = defaultdict(list)
+        for linha in linhas:
+            esp = linha.especialidade_preferencial
+            chave = esp.strip() if esp and esp.strip() else "SEM_PREFERENCIA"
+            mapa[chave].append(linha.id)
+
+        agora = time.monotonic()
+        return {
+            "indice": {linha.id: linha for linha in linhas}, "mapa": dict(sorted(mapa.items())),
+            "assinatura": self._assinatura(db, unidade), "carregado_em": agora, "verificado_em": agora,
+        }
+
+    def _valida(self, db: Session, unidade: str, entrada) -> bool:
+        if entrada is None: return False
+        agora = time.monotonic()
+        if agora - entrada["carregado_em"] >= self.ttl: return False
+        if agora - entrada["verificado_em"] < self.intervalo: return True
+        if self._assinatura(db, unidade) != entrada["assinatura"]: return False
+        entrada["verificado_em"] = agora
+        return True
+
+    def _obter(self, db: Session, unidade: str):
+        entrada = self._por_unidade.get(unidade)
+        if not self._valida(db, unidade, entrada):
+            with self._lock:
+                entrada = self._por_unidade.get(unidade)
+                if not self._valida(db, unidade, entrada):
+                    entrada = self._por_unidade[unidade] = self._carregar(db, unidade)
+        return entrada
+
+    def indice_salas(self, db: Session, unidade: str = UNIDADE_PADRAO) -> dict:
+        return self._obter(db, unidade)["indice"]
+
+    def mapa_especialidades(self, db: Session, unidade: str = UNIDADE_PADRAO) -> dict:
+        return self._obter(db, unidade)["mapa"]
+
+    def marcar_alteracao(self, db: Session, unidade: str):
+        # Não faz commit: entra na transação de quem alterou as salas
+        if not db.query(VersaoSalas).filter(VersaoSalas.unidade == unidade) \
+                .update({VersaoSalas.versao: VersaoSalas.versao + 1}):
+            db.add(VersaoSalas(unidade=unidade, versao=1))
+
+    def invalidar(self, unidade: str = None):
+        with self._lock:
+            if unidade is None: self._por_unidade.clear()
+            else: self._por_unidade.pop(unidade, None)
+
+cache_salas = CacheSalas()
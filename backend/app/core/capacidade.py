@@ -0,0 +1,242 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from types import SimpleNamespace
+from collections import defaultdict, deque
+from app.models import Grade
+from app.database import UNIDADE_PADRAO
+from app.core.cache import cache_salas
+from app.core.scoring import obter_regras
+from app.core.optimizer import identificar_clusters_preferenciais
+
+DIAS = ["SEG", "TER", "QUA", "QUI", "SEX"]
+TURNOS = ["MANHA", "TARDE", "NOITE"]
+
+ORIGEM, DESTINO = ("origem",), ("destino",)
+SEM_LIMITE = 10 ** 9
+
+class _RedeFluxo:
+    """
+    Fluxo máximo bipartido especialidade -> classe de sala (Edmonds-Karp).
+    oferta: {classe: qtd}, compativel: {esp: [classes]}. A demanda entra aos poucos por
+    adicionar_demanda(), na mesma ordem em que o otimizador atende as grades: um caminho
+    aumentante nunca reduz o fluxo que já sai da origem, então quem entra antes não perde salas.
+    """
+
+    def __init__(self, oferta: dict, compativel: dict):
+        self.demanda = defaultdict(int)
+        self.cap = defaultdict(lambda: defaultdict(int))
+        for esp, classes in compativel.items():
+            for classe in classes:
+                if oferta.get(classe): self.cap[("esp", esp)][("classe", classe)] = SEM_LIMITE
+        for classe, qtd in oferta.items():
+            self.cap[("classe", classe)][DESTINO] = qtd
+        self.total = 0
+
+    def _busca(self, ate_destino: bool = True) -> dict:
+        anterior = {ORIGEM: None}
+        fila = deque([ORIGEM])
+        while fila:
+            no = fila.popleft()
+            for vizinho, c in self.cap[no].items():
+                if c > 0 and vizinho not in anterior:
+                    anterior[vizinho] = no
+                    if ate_destino and vizinho == DESTINO: return anterior
+                    fila.append(vizinho)
+        return anterior
+
+    def aumentar(self) -> int:
+        while True:
+            anterior = self._busca()
+            if DESTINO not in anterior: return self.total
+            caminho, no = [], DESTINO
+            while anterior[no] is not None:
+                caminho.append((anterior[no], no))
+                no = anterior[no]
+            gargalo = min(self.cap[a][b] for a, b in caminho)
+            for a, b in caminho:
+                self.cap[a][b] -= gargalo
+                self.cap[b][a] += gargalo
+            self.total += gargalo
+
+    def adicionar_demanda(self, esp, qtd: int) -> int:
+        self.demanda[esp] += qtd
+        self.cap[ORIGEM][("esp", esp)] += qtd
+        return self.aumentar()
+
+    def especialidades_alcancaveis(self) -> set:
+        """Especialidades que ainda receberiam fluxo se surgisse uma sala compatível."""
+        return {no[1] for no in self._busca(ate_destino=False) if no[0] == "esp"}
+
+    def adicionar_sala(self, classe, especialidades):
+        for esp in especialidades:
+            self.cap[("esp", esp)][("classe", classe)] = SEM_LIMITE
+        self.cap[("classe", classe)][DESTINO] += 1
+
+    def atendidos(self) -> dict:
+        # O fluxo de cada especialidade é a capacidade residual da aresta de volta para a origem
+        return {esp: self.cap[("esp", esp)][ORIGEM] for esp in self.demanda}
+
+def _classe(sala):
+    # Salas com os mesmos atributos recebem o mesmo score de qualquer grade
+    restrita = isinstance(sala.features, list) and "RESTRICTED_SPECIALTY" in sala.features
+    return (sala.bloco, str(sala.andar), sala.especialidade_preferencial or "", restrita)
+
+def analisar_capacidade(db: Session, unidade: str = UNIDADE_PADRAO, dia: str = None, turno: str = None):
+    """
+    Demanda (grades) x oferta (salas) por especialidade, dia e turno, antes de alocar.
+    Uma sala é compatível com a especialidade quando o score das regras (sem bônus de
+    histórico) fica acima do mínimo.
+
+    O fluxo máximo é o melhor encaixe possível, não o que o otimizador guloso vai obter:
+    `atendiveis` é um limite superior de grades alocadas e `conflitos_minimos` um limite
+    inferior de conflitos. Quando `conflitos_minimos` > 0 há conflito garantido no slot;
+    quando é 0, o otimizador ainda pode gerar conflitos.
+
+    A divisão por especialidade segue a ordem de `regras.prioridade`, como no otimizador:
+    a demanda de cada prioridade só disputa as salas que as anteriores deixaram. Dentro
+    da mesma prioridade a divisão é aproximada (ordem da primeira grade de cada grupo).
+    """
+    salas = list(cache_salas.indice_salas(db, unidade).values())
+    ativas = [s for s in salas if not s.is_maintenance]
+    manutencao = [s for s in salas if s.is_maintenance]
+
+    oferta = defaultdict(int)
+    representante = {}
+    for s in ativas:
+        oferta[_classe(s)] += 1
+        representante.setdefault(_classe(s), s)
+
+    regras = obter_regras()
+    cluster_map = identificar_clusters_preferenciais(None, ativas)
+    avaliador = regras.avaliador(cluster_map)
+
+    # Demanda agregada numa única consulta; o nome entra no agrupamento porque a prioridade depende dele
+    filtros = [Grade.unidade == unidade]
+    if dia: filtros.append(Grade.dia_semana == dia)
+    if turno: filtros.append(Grade.turno == turno)
+    demanda_slot = defaultdict(lambda: defaultdict(int))
+    fila_slot = defaultdict(list) # (prioridade, primeira grade, especialidade, qtd)
+    for esp, nome, d, t, qtd, primeira in db.query(
+        Grade.especialidade, Grade.nome_profissional, Grade.dia_semana, Grade.turno,
+        func.count(Grade.id), func.min(Grade.id)
+    ).filter(*filtros).group_by(Grade.especialidade, Grade.nome_profissional, Grade.dia_semana, Grade.turno):
+        demanda_slot[(d, t)][esp] += qtd
+        prioridade = regras.prioridade(SimpleNamespace(especialidade=esp, nome_profissional=nome), cluster_map)
+        fila_slot[(d, t)].append((prioridade, primeira, esp, qtd))
+    especialidades = {esp for por_esp in demanda_slot.values() for esp in por_esp}
+
+    def compativeis(salas_por_classe: dict) -> dict:
+        return {
+            esp: [
+                classe for classe, sala in salas_por_classe.items()
+                if avaliador.avaliar(esp, sala, ())[0] > regras.score_minimo
+            ]
+            for esp in especialidades
+        }
+
+    compativel = compativeis(representante)
+
+    # Salas em manutenção avaliadas como se estivessem liberadas
+    reabertas = {}
+    for s in manutencao:
+        sala = SimpleNamespace(**s._asdict())
+        sala.is_maintenance = False
+        reabertas.setdefault(_classe(s), []).append(sala)
+    compativel_reaberta = compativeis({classe: lista[0] for classe, lista in reabertas.items()})
+
+    slots = []
+    for d in DIAS:
+        for t in TURNOS:
+            demanda = demanda_slot.get((d, t))
+            if not demanda: continue
+
+            rede = _RedeFluxo(oferta, compativel)
+            for _, _, esp, qtd in sorted(fila_slot[(d, t)]):
+                atendiveis = rede.adicionar_demanda(esp, qtd)
+            por_esp = rede.atendidos()
+            total_demanda = sum(demanda.values())
+
+            especialidades_slot = []
+            for esp, qtd in sorted(demanda.items(), key=lambda x: -x[1]):
+                especialidades_slot.append({
+                    "especialidade": esp,
+                    "demanda": qtd,
+                    "oferta_dedicada": sum(n for classe, n in oferta.items() if classe[2] == esp),
+                    "oferta_compativel": sum(oferta[classe] for classe in compativel[esp]),
+                    "atendiveis": por_esp[esp],
+                    "deficit": qtd - por_esp[esp],
+                })
+
+            sugestoes = []
+            if atendiveis < total_demanda:
+                sugestoes = _sugerir_reaberturas(rede, reabertas, compativel_reaberta, total_demanda)
+
+            slots.append({
+                "dia": d, "turno": t,
+                "demanda": total_demanda,
+                "salas_ativas": len(ativas),
+                "atendiveis": atendiveis,
+                "conflitos_minimos": total_demanda - atendiveis,
+                "especialidades": especialidades_slot,
+                "sugestoes_manutencao": sugestoes,
+            })
+
+    oferta_bloco = defaultdict(lambda: {"salas_ativas": 0, "salas_manutencao": 0})
+    for s in salas:
+        chave = (s.especialidade_preferencial, s.bloco)
+        oferta_bloco[chave]["salas_manutencao" if s.is_maintenance else "salas_ativas"] += 1
+
+    return {
+        "unidade": unidade,
+        "versao_regras": regras.versao,
+        "observacao": "atendiveis é o máximo teórico (fluxo máximo); o otimizador guloso pode "
+                      "alocar menos, então conflitos_minimos é um limite inferior.",
+        "resumo": {
+            "demanda_total": sum(s["demanda"] for s in slots),
+            "salas_ativas": len(ativas),
+            "salas_manutencao": len(manutencao),
+            "slots_com_conflito": sum(1 for s in slots if s["conflitos_minimos"]),
+            "conflitos_minimos": sum(s["conflitos_minimos"] for s in slots),
+        },
+        "slots": slots,
+        "oferta": [
+            {"especialidade_preferencial": esp, "bloco": bloco, **qtd}
+            for (esp, bloco), qtd in sorted(oferta_bloco.items(), key=lambda x: (str(x[0][0]), str(x[0][1])))
+        ],
+    }
+
+def _sugerir_reaberturas(rede: _RedeFluxo, reabertas: dict, compativel_reaberta: dict, total_demanda: int):
+    """
+    Escolhe, uma a uma, salas em manutenção que aumentam o número de grades atendidas.
+    Cada sala acrescenta no máximo uma grade ao fluxo, então basta checar se alguma
+    especialidade ainda alcançável na rede residual é compatível com ela. A especialidade
+    atendida é a que ganhou fluxo depois de incluir a sala.
+    """
+    disponiveis = {classe: list(lista) for classe, lista in reabertas.items()}
+    sugestoes = []
+
+    while rede.total < total_demanda:
+        alcancaveis = rede.especialidades_alcancaveis()
+        atendidos = rede.atendidos()
+
+        melhor, melhor_deficit = None, 0
+        for classe, lista in disponiveis.items():
+            if not lista: continue
+            esps = [esp for esp in alcancaveis if classe in compativel_reaberta.get(esp, ())]
+            deficit = sum(rede.demanda[esp] - atendidos[esp] for esp in esps)
+            if esps and deficit > melhor_deficit:
+                melhor, melhor_deficit = classe, deficit
+        if melhor is None: break
+
+        sala = disponiveis[melhor].pop(0)
+        rede.adicionar_sala(("reaberta",) + melhor, [
+            esp for esp in rede.demanda if melhor in compativel_reaberta.get(esp, ())
+        ])
+        rede.aumentar()
+        depois = rede.atendidos()
+        sugestoes.append({
+            "sala_id": sala.id, "bloco": sala.bloco, "andar": sala.andar,
+            "especialidade_atendida": next((esp for esp in depois if depois[esp] > atendidos[esp]), None),
+            "conflitos_minimos_restantes": total_demanda - rede.total,
+        })
+    return sugestoes
@@ -1,7 +1,18 @@
 from sqlalchemy.orm import Session
 from app.models import Sala, Grade, Alocacao
+from app.database import UNIDADE_PADRAO
 from collections import defaultdict, Counter
-import re, statistics
+from app.core.scoring import obter_regras
+from app.core.cache import cache_salas
+import re, statistics, threading
+
+# Um lock por unidade: unidades diferentes alocam em paralelo, a mesma unidade em série
+_locks_unidade = defaultdict(threading.Lock)
+_locks_guard = threading.Lock()
+
+def lock_da_unidade(unidade: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks_unidade[unidade]
 
 # --- Funções Auxiliares ---
 def extrair_numero_sala(nome_visual: str) -> int:
@@ -30,68 +41,30 @@ def identificar_clusters_preferenciais(grades, salas):
     return cluster_map
 
 def calcular_score(grade: Grade, sala: Sala, cluster_ideal: tuple, historico_uso: set) -> int:
-    if sala.is_maintenance: return -999999
-    
-    score = 0
-    sala_esp = sala.especialidade_preferencial
-    grade_esp = grade.especialidade
-    
-    is_restricted = False
-    if sala.features and isinstance(sala.features, list) and "RESTRICTED_SPECIALTY" in sala.features:
-        is_restricted = True
-    
-    # 1. CONSISTÊNCIA DE SALA
-    if sala.id in historico_uso:
-        score += 50000 
-
-    # 2. NAO MAPEADO (Penalidade)
-    if grade_esp == "NAO MAPEADO":
-        if sala_esp == "NAO MAPEADO": return 50
-        return -800 
-    
-    # 3. SALA ESPECIALIZADA (Prioridade Máxima)
-    if is_restricted:
-        if sala_esp == grade_esp: return 20000 
-        else: return -999999 # Bloqueio: Oftalmo não entra em Ginecologia
-            
-    # 4. MATCH DE NOME
-    if sala_esp == grade_esp: score += 1000
-    elif grade_esp in sala_esp: score += 800
-    
-    # 5. CLUSTER
-    if cluster_ideal:
-        bloco_ideal, andar_ideal = cluster_ideal
-        if sala.bloco == bloco_ideal and str(sala.andar) == str(andar_ideal):
-            score += 500
-        elif sala.bloco == bloco_ideal:
-            score += 200
-    
-    # 6. REGRAS FÍSICAS
-    if "ORTOPEDIA" in grade_esp:
-        if str(sala.andar) == "0": score += 2000
-        else: score -= 2000
-    if "OFTALMO" in grade_esp and "OFTALMO" not in sala_esp:
-        score -= 5000 
-
-    # 7. PENALIDADE DE INVASÃO
-    # Clínica Médica usando sala de outra especialidade
-    if sala_esp != grade_esp and grade_esp not in sala_esp:
-        score -= 300 # Aumentei penalidade para evitar espalhamento
-
+    # Avaliação avulsa; na alocação em lote usamos o AvaliadorScore pré-calculado
+    regras = obter_regras()
+    avaliador = regras.avaliador({grade.especialidade: cluster_ideal} if cluster_ideal else {})
+    score, _ = avaliador.avaliar(grade.especialidade, sala, historico_uso)
     return score
 
-def gerar_alocacao_grade(db: Session):
-    db.query(Alocacao).delete()
+def gerar_alocacao_grade(db: Session, unidade: str = UNIDADE_PADRAO):
+    with lock_da_unidade(unidade):
+        return _gerar_alocacao_unidade(db, unidade)
+
+def _gerar_alocacao_unidade(db: Session, unidade: str):
+    db.query(Alocacao).filter(Alocacao.unidade == unidade).delete()
     
-    grades = db.query(Grade).all()
+    grades = db.query(Grade).filter(Grade.unidade == unidade).all()
     # Carrega APENAS salas ativas
-    salas = db.query(Sala).filter(Sala.is_maintenance == False).all()
+    salas = db.query(Sala).filter(Sala.unidade == unidade, Sala.is_maintenance == False).all()
     
     if not grades or not salas: return {"erro": "Sem dados"}
     
     TOTAL_SALAS_FISICAS = len(salas)
 
     cluster_map = identificar_clusters_preferenciais(grades, salas)
+    regras = obter_regras()
+    avaliador = regras.avaliador(cluster_map)
     
     ocupacao = {
         d: {t: set() for t in ["MANHA", "TARDE", "NOITE"]} 
@@ -103,23 +76,7 @@ def gerar_alocacao_grade(db: Session):
     resultado_detalhado = []
     conflitos = []
 
-    def sort_priority(g):
-        prio = 50
-        if g.especialidade == "NAO MAPEADO": prio = 100
-        
-        # Restrições Físicas Fortes furam a fila
-        if "ORTOPEDIA" in g.especialidade: prio = 0
-        elif "OFTALMO" in g.especialidade: prio = 1
-        elif "GINECOLOGIA" in g.especialidade: prio = 2
-        
-        # Quem tem sala própria especializada
-        elif g.especialidade in cluster_map: prio = 10 
-        
-        elif g.nome_profissional.startswith("Dr"): prio = 20
-        
-        return prio
-
-    grades_ordenadas = sorted(grades, key=sort_priority)
+    grades_ordenadas = sorted(grades, key=lambda g: regras.prioridade(g, cluster_map))
 
     for item_grade in grades_ordenadas:
         dia = item_grade.dia_semana
@@ -137,31 +94,35 @@ def gerar_alocacao_grade(db: Session):
 
         melhor_sala = None
         melhor_score = -float('inf')
-        cluster_alvo = cluster_map.get(item_grade.especialidade)
+        melhor_detalhe = []
         historico_uso_esp = historico_alocacao[item_grade.especialidade]
         
         for sala in salas:
             if dia not in ocupacao: continue
             if sala.id in ocupacao[dia][turno]: continue
                 
-            score = calcular_score(item_grade, sala, cluster_alvo, historico_uso_esp)
+            score, detalhe = avaliador.avaliar(item_grade.especialidade, sala, historico_uso_esp)
             
             if score > melhor_score:
                 melhor_score = score
                 melhor_sala = sala
+                melhor_detalhe = detalhe
             elif score == melhor_score:
                 if melhor_sala and sala.id < melhor_sala.id:
                     melhor_sala = sala
+                    melhor_detalhe = detalhe
         
-        limit_score = -500 
+        limit_score = regras.score_minimo
         
         if melhor_sala and melhor_score > limit_score:
             nova_alocacao = Alocacao(
+                unidade=unidade,
                 sala_id=melhor_sala.id,
                 grade_id=item_grade.id,
                 dia_semana=item_grade.dia_semana,
                 turno=item_grade.turno,
-                score=melhor_score
+                score=melhor_score,
+                score_detalhado=melhor_detalhe
             )
             db.add(nova_alocacao)
             
@@ -176,7 +137,8 @@ def gerar_alocacao_grade(db: Session):
                 "andar": melhor_sala.andar,
                 "dia": item_grade.dia_semana,
                 "turno": item_grade.turno,
-                "score": melhor_score
+                "score": melhor_score,
+                "score_detalhado": melhor_detalhe
             })
         else:
             conflitos.append({
@@ -222,10 +184,13 @@ def construir_resumo_json(detalhes, conflitos):
         "conflitos": conflitos
     }
 
-def descobrir_andar_predominante(db: Session, especialidade: str):
+def descobrir_andar_predominante(db: Session, especialidade: str, unidade: str = UNIDADE_PADRAO):
     if not especialidade: return None, None
     term = especialidade.upper().strip()
-    salas_da_esp = db.query(Sala).filter(Sala.especialidade_preferencial.contains(term)).all()
+    salas_da_esp = [
+        s for s in cache_salas.indice_salas(db, unidade).values()
+        if s.especialidade_preferencial and term in s.especialidade_preferencial.upper()
+    ]
     if not salas_da_esp: return None, None
     lista_andares = [s.andar for s in salas_da_esp]
     if not lista_andares: return None, None
@@ -241,8 +206,74 @@ def calcular_afinidade_tempo_real(sala: Sala, especialidade_medico: str, andar_a
     if andar_alvo and str(sala.andar).strip() == str(andar_alvo).strip(): score += 30
     return round(score, 1)
 
-def obter_resumo_atual(db: Session):
-    alocacoes = db.query(Alocacao, Sala, Grade).join(Sala).join(Grade).all()
+def _atribuicao_minimo_custo(custo):
+    """Método húngaro (linhas <= colunas). Retorna a coluna escolhida para cada linha."""
+    n, m = len(custo), len(custo[0])
+    INF = float('inf')
+    u, v = [0] * (n + 1), [0] * (m + 1)
+    p, way = [0] * (m + 1), [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [INF] * (m + 1)
+        usado = [False] * (m + 1)
+        while True:
+            usado[j0] = True
+            i0, delta, j1 = p[j0], INF, 0
+            for j in range(1, m + 1):
+                if usado[j]: continue
+                atual = custo[i0 - 1][j - 1] - u[i0] - v[j]
+                if atual < minv[j]: minv[j], way[j] = atual, j0
+                if minv[j] < delta: delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if usado[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0: break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    resultado = [None] * n
+    for j in range(1, m + 1):
+        if p[j]: resultado[p[j] - 1] = j - 1
+    return resultado
+
+def atribuir_checkins_conjuntos(db: Session, pedidos: list, salas_livres: list, unidade: str = UNIDADE_PADRAO):
+    """
+    Distribui vários check-ins inteligentes de uma vez, maximizando a afinidade total
+    em vez de deixar o primeiro pedido levar a melhor sala de todos.
+    pedidos: lista de especialidades. Retorna a sala (ou None) de cada pedido, na mesma ordem.
+    """
+    if not pedidos or not salas_livres: return [None] * len(pedidos)
+
+    andares = {}
+    for esp in set(pedidos):
+        andares[esp] = descobrir_andar_predominante(db, esp, unidade)
+
+    # Afinidade em décimos (inteiro); o índice da sala desempata a favor da ordem da consulta,
+    # como no check-in individual. Colunas extras (sem sala) sobram se faltar sala livre.
+    m = len(salas_livres)
+    colunas = m + max(0, len(pedidos) - m)
+    fator = len(pedidos) * colunas + 1 # soma dos desempates nunca supera 1 ponto de afinidade
+    custo = []
+    for esp in pedidos:
+        andar_alvo, num_alvo = andares[esp]
+        linha = [
+            -(int(round(calcular_afinidade_tempo_real(sala, esp, andar_alvo, num_alvo) * 10)) + 1) * fator + j
+            for j, sala in enumerate(salas_livres)
+        ]
+        linha += [0] * (colunas - m)
+        custo.append(linha)
+
+    escolhas = _atribuicao_minimo_custo(custo)
+    return [salas_livres[j] if j is not None and j < m else None for j in escolhas]
+
+def obter_resumo_atual(db: Session, unidade: str = UNIDADE_PADRAO):
+    alocacoes = db.query(Alocacao, Sala, Grade).join(Sala).join(Grade).filter(Alocacao.unidade == unidade).all()
     
     if not alocacoes:
         return {"resumo_ambulatorios": [], "alocacoes_detalhadas": []}
@@ -257,7 +288,8 @@ def obter_resumo_atual(db: Session):
             "andar": sala.andar,
             "dia": aloc.dia_semana,
             "turno": aloc.turno,
-            "score": aloc.score
+            "score": aloc.score,
+            "score_detalhado": aloc.score_detalhado
         })
     
     return construir_resumo_json(resultado_detalhado, [])
\ No newline at end of file
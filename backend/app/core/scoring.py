@@ -0,0 +1,191 @@
+import json, os, threading
+from app.models import Sala, Grade
+
+# Arquivo versionado com as regras de pontuação (pode ser sobrescrito via env)
+CAMINHO_REGRAS = os.environ.get(
+    "GDS_REGRAS_SCORE", os.path.join(os.path.dirname(__file__), "regras_score.json")
+)
+
+TIPOS_REGRA = ("peso", "fixo", "bloqueio")
+
+class _Contexto:
+    """Dados que os predicados enxergam ao avaliar um par (grade, sala)."""
+    __slots__ = ("grade_esp", "profissional", "sala", "sala_esp", "cluster", "no_historico", "possui_cluster")
+
+    def __init__(self, grade_esp, profissional="", sala=None, cluster=None, no_historico=False, possui_cluster=False):
+        self.grade_esp = grade_esp or ""
+        self.profissional = profissional or ""
+        self.sala = sala
+        self.sala_esp = (sala.especialidade_preferencial or "") if sala is not None else ""
+        self.cluster = cluster
+        self.no_historico = no_historico
+        self.possui_cluster = possui_cluster
+
+def _relacao_especialidade(ctx):
+    if ctx.sala_esp == ctx.grade_esp: return "IGUAL"
+    if ctx.grade_esp in ctx.sala_esp: return "CONTIDA"
+    return "DIFERENTE"
+
+def _relacao_cluster(ctx):
+    if not ctx.cluster: return None
+    bloco_ideal, andar_ideal = ctx.cluster
+    if ctx.sala.bloco == bloco_ideal and str(ctx.sala.andar) == str(andar_ideal): return "MESMO_ANDAR"
+    if ctx.sala.bloco == bloco_ideal: return "MESMO_BLOCO"
+    return None
+
+def _sala_restrita(ctx):
+    features = ctx.sala.features
+    return bool(features) and isinstance(features, list) and "RESTRICTED_SPECIALTY" in features
+
+# Cada chave de "quando" vira um predicado compilado: valor_config -> (ctx -> bool)
+PREDICADOS = {
+    "sala_manutencao": lambda v: lambda ctx: bool(ctx.sala.is_maintenance) == v,
+    "sala_restrita": lambda v: lambda ctx: _sala_restrita(ctx) == v,
+    "no_historico": lambda v: lambda ctx: ctx.no_historico == v,
+    "possui_cluster": lambda v: lambda ctx: ctx.possui_cluster == v,
+    "grade_especialidade": lambda v: lambda ctx: ctx.grade_esp == v,
+    "grade_especialidade_contem": lambda v: lambda ctx: v in ctx.grade_esp,
+    "sala_especialidade": lambda v: lambda ctx: ctx.sala_esp == v,
+    "sala_especialidade_contem": lambda v: lambda ctx: v in ctx.sala_esp,
+    "sala_andar": lambda v: lambda ctx: str(ctx.sala.andar) == str(v),
+    "especialidade": lambda v: lambda ctx: _relacao_especialidade(ctx) == v,
+    "cluster": lambda v: lambda ctx: _relacao_cluster(ctx) == v,
+    "profissional_comeca_com": lambda v: lambda ctx: ctx.profissional.startswith(v),
+}
+
+# Cada lista de regras só enxerga parte do contexto: o score é pré-calculado por
+# (especialidade, sala) e a prioridade é calculada por grade, sem sala.
+PREDICADOS_SCORE = {
+    "sala_manutencao", "sala_restrita", "no_historico", "grade_especialidade",
+    "grade_especialidade_contem", "sala_especialidade", "sala_especialidade_contem",
+    "sala_andar", "especialidade", "cluster",
+}
+PREDICADOS_PRIORIDADE = {
+    "grade_especialidade", "grade_especialidade_contem", "possui_cluster", "profissional_comeca_com",
+}
+
+def compilar_condicao(quando: dict, permitidos: set = None):
+    if not isinstance(quando, dict):
+        raise ValueError(f"Condição inválida: {quando!r}")
+    permitidos = set(PREDICADOS) if permitidos is None else permitidos
+    testes = []
+    for chave, valor in quando.items():
+        if chave == "nao":
+            interno = compilar_condicao(valor, permitidos)
+            testes.append(lambda ctx, f=interno: not f(ctx))
+        elif chave not in PREDICADOS:
+            raise ValueError(f"Predicado desconhecido: '{chave}'")
+        elif chave not in permitidos:
+            raise ValueError(f"Predicado '{chave}' não é permitido aqui (use: {', '.join(sorted(permitidos))})")
+        else:
+            testes.append(PREDICADOS[chave](valor))
+    return lambda ctx: all(t(ctx) for t in testes)
+
+class RegrasScore:
+    """Regras de pontuação já compiladas a partir do arquivo de configuração."""
+
+    def __init__(self, config: dict):
+        self.versao = config.get("versao", 0)
+        self.score_bloqueio = int(config.get("score_bloqueio", -999999))
+        self.score_minimo = int(config.get("score_minimo", -500))
+        self.config = config
+
+        self.regras = []
+        for regra in config.get("regras", []):
+            tipo = regra.get("tipo")
+            if tipo not in TIPOS_REGRA:
+                raise ValueError(f"Tipo de regra inválido em '{regra.get('id')}': {tipo}")
+            peso = self.score_bloqueio if tipo == "bloqueio" else int(regra.get("peso", 0))
+            try:
+                condicao = compilar_condicao(regra.get("quando", {}), PREDICADOS_SCORE)
+            except ValueError as e:
+                raise ValueError(f"Regra de score '{regra.get('id')}': {e}")
+            self.regras.append((regra["id"], tipo, peso, condicao))
+
+        prioridade = config.get("prioridade", {})
+        self.prioridade_padrao = prioridade.get("padrao", 50)
+        self.regras_prioridade = []
+        for regra in prioridade.get("regras", []):
+            try:
+                condicao = compilar_condicao(regra.get("quando", {}), PREDICADOS_PRIORIDADE)
+            except ValueError as e:
+                raise ValueError(f"Regra de prioridade '{regra.get('id')}': {e}")
+            self.regras_prioridade.append((int(regra["prioridade"]), condicao))
+
+    def pontuar(self, ctx: _Contexto):
+        """Retorna (score, detalhamento) percorrendo as regras em ordem."""
+        score = 0
+        detalhe = []
+        for regra_id, tipo, peso, condicao in self.regras:
+            if not condicao(ctx): continue
+            if tipo == "peso":
+                score += peso
+                detalhe.append({"regra": regra_id, "pontos": peso})
+            else:
+                # "fixo" e "bloqueio" encerram a avaliação descartando o acumulado
+                return peso, [{"regra": regra_id, "pontos": peso}]
+        return score, detalhe
+
+    def prioridade(self, grade: Grade, cluster_map: dict) -> int:
+        ctx = _Contexto(
+            grade.especialidade, grade.nome_profissional,
+            possui_cluster=grade.especialidade in cluster_map
+        )
+        for valor, condicao in self.regras_prioridade:
+            if condicao(ctx): return valor
+        return self.prioridade_padrao
+
+    def avaliador(self, cluster_map: dict):
+        return AvaliadorScore(self, cluster_map)
+
+class AvaliadorScore:
+    """
+    Tabela pré-calculada por (especialidade, sala) para uma rodada de alocação.
+    O único dado que muda durante a rodada é o histórico de uso, então cada
+    entrada guarda os dois resultados possíveis (fora/dentro do histórico).
+    """
+
+    def __init__(self, regras: RegrasScore, cluster_map: dict):
+        self.regras = regras
+        self.cluster_map = cluster_map
+        self._tabela = {}
+
+    def _calcular(self, especialidade: str, sala: Sala):
+        cluster = self.cluster_map.get(especialidade)
+        return tuple(
+            self.regras.pontuar(_Contexto(especialidade, sala=sala, cluster=cluster, no_historico=no_hist))
+            for no_hist in (False, True)
+        )
+
+    def avaliar(self, especialidade: str, sala: Sala, historico_uso: set):
+        chave = (especialidade, sala.id)
+        entrada = self._tabela.get(chave)
+        if entrada is None:
+            entrada = self._tabela[chave] = self._calcular(especialidade, sala)
+        return entrada[sala.id in historico_uso]
+
+# --- Carga com hot-reload ---
+_lock = threading.Lock()
+_estado = {"mtime": None, "regras": None}
+
+def carregar_regras(caminho: str = None) -> RegrasScore:
+    with open(caminho or CAMINHO_REGRAS, encoding="utf-8") as f:
+        return RegrasScore(json.load(f))
+
+def obter_regras(forcar: bool = False) -> RegrasScore:
+    """Recompila as regras quando o arquivo muda; mantém a versão anterior se o novo for inválido."""
+    try:
+        mtime = os.path.getmtime(CAMINHO_REGRAS)
+    except OSError:
+        mtime = None
+
+    with _lock:
+        if forcar or _estado["regras"] is None or mtime != _estado["mtime"]:
+            try:
+                _estado["regras"] = carregar_regras()
+                _estado["mtime"] = mtime
+            except Exception as e:
+                if forcar or _estado["regras"] is None: raise
+                _estado["mtime"] = mtime
+                print(f" [REGRAS] Falha ao recarregar '{CAMINHO_REGRAS}': {e}. Mantendo versão {_estado['regras'].versao}")
+        return _estado["regras"]
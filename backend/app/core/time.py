@@ -1,38 +1,53 @@
 from sqlalchemy.orm import Session
 from app.models import Sala, Grade, Alocacao
+from app.database import UNIDADE_PADRAO
 from datetime import datetime
 
+DIAS_MAP = {0: "SEG", 1: "TER", 2: "QUA", 3: "QUI", 4: "SEX", 5: "SAB", 6: "DOM"}
+HORAS_TURNO = {"MANHA": 7, "TARDE": 6, "NOITE": 11} # Duração de cada turno em horas
+
+def turno_da_hora(hora: int) -> str:
+    if 6 <= hora < 13: return "MANHA"
+    if 13 <= hora < 19: return "TARDE"
+    return "NOITE"
+
 def determinar_periodo_atual():
     agora = datetime.now()
-    dias_map = {0: "SEG", 1: "TER", 2: "QUA", 3: "QUI", 4: "SEX", 5: "SAB", 6: "DOM"}
-    dia_atual = dias_map.get(agora.weekday(), "SEG")
-
-    hora = agora.hour
-    if 6 <= hora < 13:
-        turno_atual = "MANHA"
-    elif 13 <= hora < 19:
-        turno_atual = "TARDE"
-    else:
-        turno_atual = "NOITE"
+    dia_atual = DIAS_MAP.get(agora.weekday(), "SEG")
+    turno_atual = turno_da_hora(agora.hour)
         
     print(f" [SISTEMA] Horário: {agora} | Dia: {dia_atual} | Turno: {turno_atual}")
     return dia_atual, turno_atual
 
-def sincronizar_status_com_alocacao(db: Session, forcar_dia: str = None, forcar_turno: str = None):
+def sincronizar_status_com_alocacao(db: Session, forcar_dia: str = None, forcar_turno: str = None, unidade: str = UNIDADE_PADRAO):
+    # Import local: app.services.ocupacao depende deste módulo
+    from app.services.ocupacao import registro_ocupacao, salas_com_checkin_registrado
+
     dia, turno = determinar_periodo_atual()
+    # Simulações (dia/turno forçados) não entram no histórico de ocupação
+    simulacao = bool(forcar_dia or forcar_turno)
     if forcar_dia: dia = forcar_dia
     if forcar_turno: turno = forcar_turno
 
+    # As transições comparam com o histórico, não com status_atual: uma simulação anterior
+    # pode ter marcado salas como OCUPADA sem registrar o CHECKIN
+    registradas = set()
+    if not simulacao:
+        registro_ocupacao.descarregar()
+        registradas = salas_com_checkin_registrado(db, unidade)
+
     # Busca alocações do momento
     alocacoes = db.query(Alocacao).filter(
+        Alocacao.unidade == unidade,
         Alocacao.dia_semana == dia,
         Alocacao.turno == turno
     ).all()
     
     mapa_reservas = {a.sala_id: a.grade_id for a in alocacoes}
-    salas = db.query(Sala).all()
+    salas = db.query(Sala).filter(Sala.unidade == unidade).all()
     count_ocupadas = 0
     agora_str = datetime.now().strftime("%H:%M")
+    transicoes = []
 
     for s in salas:
         if s.is_maintenance: continue
@@ -42,6 +57,8 @@ def sincronizar_status_com_alocacao(db: Session, forcar_dia: str = None, forcar_
             # Sala alocada!
             grade = db.query(Grade).filter(Grade.id == grade_id).first()
             if grade:
+                if s.id not in registradas:
+                    transicoes.append(("CHECKIN", s, f"{grade.nome_profissional} ({grade.especialidade})", grade.especialidade))
                 s.status_atual = "OCUPADA"
                 # Grava Nome (Especialidade) para o Monitoramento
                 s.ocupante_atual = f"{grade.nome_profissional} ({grade.especialidade})"
@@ -55,6 +72,8 @@ def sincronizar_status_com_alocacao(db: Session, forcar_dia: str = None, forcar_
             # Sala Livre
             # Se estava ocupada por alocação automática, limpa.
             # (Mantém se tiver lógica de check-in manual persistente, mas aqui resetamos para refletir o turno)
+            if s.id in registradas:
+                 transicoes.append(("CHECKOUT", s, None, None))
             if s.status_atual == "OCUPADA":
                  s.status_atual = "LIVRE"
                  s.ocupante_atual = None
@@ -62,4 +81,8 @@ def sincronizar_status_com_alocacao(db: Session, forcar_dia: str = None, forcar_
                  s.horario_entrada = None
 
     db.commit()
+
+    if not simulacao:
+        for tipo, sala, ocupante, especialidade in transicoes:
+            registro_ocupacao.registrar(tipo, sala, "ALOCACAO", ocupante, especialidade)
     return count_ocupadas, dia, turno
\ No newline at end of file
@@ -1,9 +1,20 @@
-from sqlalchemy import create_engine
+import os, re
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./gds_poc.db"
 
+# Unidade hospitalar usada quando a requisição não informa uma
+UNIDADE_PADRAO = os.environ.get("GDS_UNIDADE_PADRAO", "HC")
+
+def normalizar_unidade(unidade: str) -> str:
+    # O nome da unidade vira pasta (data/<unidade>/) e chave no banco: só letras, números, _ e -
+    valor = (unidade or "").strip().upper() or UNIDADE_PADRAO
+    if not re.fullmatch(r"[A-Z0-9_-]+", valor):
+        raise ValueError(f"Unidade inválida: '{unidade}'")
+    return valor
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
@@ -16,4 +27,57 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def init_db():
+    # Criação do schema fora do import: roda no startup da API ou via `python -m app.database`
+    from app import models  # registra as tabelas no Base
+    migrar_schema(models)
+    models.Base.metadata.create_all(bind=engine)
+
+def migrar_schema(models):
+    """
+    Atualiza bancos criados antes da coluna `unidade` e do `score_detalhado`. create_all só
+    cria tabelas novas, então as existentes são ajustadas aqui; os dados antigos ficam na
+    unidade padrão. Bancos já atualizados (ou vazios) passam direto.
+    """
+    existentes = inspect(engine).get_table_names()
+    colunas = {t: {c["name"] for c in inspect(engine).get_columns(t)} for t in existentes}
+
+    with engine.begin() as conn:
+        # O PK de salas muda para (unidade, id) e o FK de alocacoes passa a ser composto:
+        # no SQLite isso exige recriar a tabela
+        if "salas" in colunas and "unidade" not in colunas["salas"]:
+            _recriar_tabela(conn, models.Sala.__table__, colunas["salas"])
+        if "grades" in colunas and "unidade" not in colunas["grades"]:
+            conn.execute(text("ALTER TABLE grades ADD COLUMN unidade VARCHAR"))
+            conn.execute(text("UPDATE grades SET unidade = :u"), {"u": UNIDADE_PADRAO})
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_grades_unidade ON grades (unidade)"))
+        if "alocacoes" in colunas and "unidade" not in colunas["alocacoes"]:
+            _recriar_tabela(conn, models.Alocacao.__table__, colunas["alocacoes"])
+        elif "alocacoes" in colunas and "score_detalhado" not in colunas["alocacoes"]:
+            conn.execute(text("ALTER TABLE alocacoes ADD COLUMN score_detalhado JSON"))
+
+def _recriar_tabela(conn, tabela, colunas_antigas: set):
+    print(f" [SCHEMA] Migrando '{tabela.name}' para o schema com unidade ({UNIDADE_PADRAO})")
+    antiga = f"{tabela.name}_antiga"
+    # Sem o modo legado, o RENAME reescreveria os FKs das outras tabelas para a tabela antiga
+    conn.execute(text("PRAGMA legacy_alter_table = ON"))
+    conn.execute(text(f"ALTER TABLE {tabela.name} RENAME TO {antiga}"))
+    conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+    # Índices mantêm o nome após o rename e colidiriam com os da tabela nova
+    for (indice,) in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"
+    ), {"t": antiga}).all():
+        conn.execute(text(f"DROP INDEX {indice}"))
+    tabela.create(conn)
+
+    copiar = [c.name for c in tabela.columns if c.name in colunas_antigas]
+    conn.execute(text(
+        f"INSERT INTO {tabela.name} ({', '.join(copiar)}, unidade) "
+        f"SELECT {', '.join(copiar)}, :u FROM {antiga}"
+    ), {"u": UNIDADE_PADRAO})
+    conn.execute(text(f"DROP TABLE {antiga}"))
+
+if __name__ == "__main__":
+    init_db()
@@ -2,24 +2,45 @@ from fastapi import FastAPI, Depends, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from datetime import datetime
-from collections import defaultdict
+from datetime import datetime, date
+from typing import Optional
+from contextlib import asynccontextmanager
+import os, threading
 
-from app.database import engine, Base, SessionLocal
+from app.database import SessionLocal, UNIDADE_PADRAO, init_db, normalizar_unidade
 from app.models import Sala, Grade, Alocacao
 from app.services.importer import importar_salas_csv, importar_grades_csv
-from app.core.optimizer import (
-    gerar_alocacao_grade, 
-    calcular_afinidade_tempo_real, 
-    descobrir_andar_predominante, 
-    obter_resumo_atual
-)
 from app.core.time import sincronizar_status_com_alocacao
+from app.core.scoring import obter_regras
+from app.core.cache import cache_salas
+from app.services.ocupacao import registro_ocupacao, resumo_ocupacao
+# app.core.optimizer é importado sob demanda nas rotas de alocação/check-in inteligente
+
+# Em produção o schema pode ser criado por um job separado (python -m app.database)
+CRIAR_SCHEMA_NO_STARTUP = os.environ.get("GDS_CRIAR_SCHEMA", "1") != "0"
 
-# Inicializa o Banco
-Base.metadata.create_all(bind=engine)
+def aquecer_caches():
+    """Roda em segundo plano: a API já responde enquanto os caches são montados."""
+    try:
+        import app.core.optimizer  # noqa: F401
+        obter_regras()
+        db = SessionLocal()
+        try:
+            for (unidade,) in db.query(Sala.unidade).distinct():
+                cache_salas.indice_salas(db, unidade)
+        finally:
+            db.close()
+    except Exception as e:
+        print(f" [STARTUP] Falha ao aquecer caches: {e}")
 
-app = FastAPI(title="GDS - Gestão Dinâmica de Salas")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if CRIAR_SCHEMA_NO_STARTUP: init_db()
+    threading.Thread(target=aquecer_caches, name="aquecer-caches", daemon=True).start()
+    yield
+    registro_ocupacao.descarregar()
+
+app = FastAPI(title="GDS - Gestão Dinâmica de Salas", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +57,13 @@ def get_db():
     finally:
         db.close()
 
+def get_unidade(unidade: str = UNIDADE_PADRAO) -> str:
+    # Todas as rotas aceitam ?unidade=...; sem o parâmetro vale a unidade padrão
+    try:
+        return normalizar_unidade(unidade)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Modelos
 class NovaDemanda(BaseModel):
     medico_nome: str
@@ -51,40 +79,72 @@ class AutoCheckInRequest(BaseModel):
     medico_nome: str
     especialidade: str
 
+class OperacaoLote(BaseModel):
+    tipo: str # "CHECKIN", "CHECKIN_INTELIGENTE" ou "CHECKOUT"
+    sala_id: Optional[str] = None # Obrigatório para CHECKIN/CHECKOUT
+    medico_nome: Optional[str] = None
+    especialidade: Optional[str] = None # Obrigatório para CHECKIN_INTELIGENTE
+
+class LoteCheckInRequest(BaseModel):
+    operacoes: list[OperacaoLote]
+
 @app.get("/")
 def read_root():
     return {"message": "API GDS Online", "status": "OK", "mode": "Grade Semanal"}
 
+@app.get("/api/unidades")
+def listar_unidades(db: Session = Depends(get_db)):
+    unidades = {u for (u,) in db.query(Sala.unidade).distinct()}
+    unidades |= {u for (u,) in db.query(Grade.unidade).distinct()}
+    return sorted(u for u in unidades if u)
+
 @app.post("/api/setup/importar-salas")
-def trigger_import_salas():
-    return importar_salas_csv()
+def trigger_import_salas(unidade: str = Depends(get_unidade)):
+    return importar_salas_csv(unidade)
 
 @app.post("/api/setup/importar-grades")
-def trigger_import_grades():
-    return importar_grades_csv()
+def trigger_import_grades(unidade: str = Depends(get_unidade)):
+    return importar_grades_csv(unidade)
 
 @app.post("/api/alocacao/gerar")
-def trigger_alocacao_inteligente(teste_dia: str = None, teste_turno: str = None, db: Session = Depends(get_db)):
+def trigger_alocacao_inteligente(teste_dia: str = None, teste_turno: str = None, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    from app.core.optimizer import gerar_alocacao_grade
+
     # Gera
-    resultado = gerar_alocacao_grade(db)
+    resultado = gerar_alocacao_grade(db, unidade)
     
     # Simula status de tempo real
     try:
-        qtd_ocupadas, dia_usado, turno_usado = sincronizar_status_com_alocacao(db, forcar_dia=teste_dia, forcar_turno=teste_turno)
+        qtd_ocupadas, dia_usado, turno_usado = sincronizar_status_com_alocacao(db, forcar_dia=teste_dia, forcar_turno=teste_turno, unidade=unidade)
     except:
         qtd_ocupadas = 0
         dia_usado = "N/A"
         turno_usado = "N/A"
 
+    resultado["unidade"] = unidade
     resultado["modo"] = "TESTE MANUAL" if teste_dia else "TEMPO REAL AUTOMÁTICO"
     resultado["contexto_usado"] = f"{dia_usado} - {turno_usado}"
     resultado["salas_ocupadas_agora"] = qtd_ocupadas
     
     return resultado
 
+@app.get("/api/regras")
+def listar_regras_score():
+    regras = obter_regras()
+    return {"versao": regras.versao, "config": regras.config}
+
+@app.post("/api/regras/recarregar")
+def recarregar_regras_score():
+    try:
+        regras = obter_regras(forcar=True)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Regras inválidas: {e}")
+    return {"message": "Regras recarregadas.", "versao": regras.versao}
+
 @app.post("/api/grade/adicionar")
-def adicionar_demanda_manual(demanda: NovaDemanda, db: Session = Depends(get_db)):
+def adicionar_demanda_manual(demanda: NovaDemanda, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
     nova_grade = Grade(
+        unidade=unidade,
         nome_profissional=demanda.medico_nome,
         especialidade=demanda.especialidade,
         dia_semana=demanda.dia_semana,
@@ -94,23 +154,32 @@ def adicionar_demanda_manual(demanda: NovaDemanda, db: Session = Depends(get_db)
     )
     db.add(nova_grade)
     db.commit()
-    return {"message": "Demanda adicionada."}
+
+    # Prévia de capacidade do slot editado, para acusar sobrecarga antes de alocar
+    from app.core.capacidade import analisar_capacidade
+    slots = analisar_capacidade(db, unidade, demanda.dia_semana, demanda.turno)["slots"]
+    return {"message": "Demanda adicionada.", "capacidade_slot": slots[0] if slots else None}
 
 @app.post("/api/salas/{sala_id}/checkin")
-def realizar_checkin(sala_id: str, dados: CheckInRequest, db: Session = Depends(get_db)):
-    sala = db.query(Sala).filter(Sala.id == sala_id).first()
+def realizar_checkin(sala_id: str, dados: CheckInRequest, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    sala = db.query(Sala).filter(Sala.unidade == unidade, Sala.id == sala_id).first()
     if not sala: raise HTTPException(status_code = 404, detail="Sala não encontrada")
     
     sala.status_atual = "OCUPADA"
     sala.ocupante_atual = dados.medico_nome
     sala.horario_entrada = datetime.now().strftime("%H:%M") 
     db.commit()
+    registro_ocupacao.registrar("CHECKIN", sala, "MANUAL", dados.medico_nome)
     return {"message": f"Check-in realizado para {dados.medico_nome}", "sala": sala}
 
 @app.post("/api/salas/checkin/inteligente")
-def checkin_semiautomatico(dados: AutoCheckInRequest, db: Session = Depends(get_db)):
-    andar_predominante, num_ideal = descobrir_andar_predominante(db, dados.especialidade)
-    salas_disponiveis = db.query(Sala).filter(Sala.status_atual == "LIVRE", Sala.is_maintenance == False).all()
+def checkin_semiautomatico(dados: AutoCheckInRequest, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    from app.core.optimizer import descobrir_andar_predominante, calcular_afinidade_tempo_real
+
+    andar_predominante, num_ideal = descobrir_andar_predominante(db, dados.especialidade, unidade)
+    salas_disponiveis = db.query(Sala).filter(
+        Sala.unidade == unidade, Sala.status_atual == "LIVRE", Sala.is_maintenance == False
+    ).all()
     if not salas_disponiveis: raise HTTPException(status_code=404, detail="Não há nenhuma sala livre.")
     
     melhor_sala = None
@@ -127,58 +196,175 @@ def checkin_semiautomatico(dados: AutoCheckInRequest, db: Session = Depends(get_
     melhor_sala.ocupante_atual = dados.medico_nome
     melhor_sala.horario_entrada = datetime.now().strftime("%H:%M")
     db.commit()
+    registro_ocupacao.registrar("CHECKIN", melhor_sala, "INTELIGENTE", dados.medico_nome, dados.especialidade.upper().strip())
     return {"mensagem": "Check-in realizado", "sala_alocada": melhor_sala}
 
 @app.post("/api/salas/{sala_id}/checkout")  
-def realizar_checkout(sala_id: str, db: Session = Depends(get_db)):
-    sala = db.query(Sala).filter(Sala.id == sala_id).first()
+def realizar_checkout(sala_id: str, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    sala = db.query(Sala).filter(Sala.unidade == unidade, Sala.id == sala_id).first()
     if not sala: raise HTTPException(status_code=404, detail="Sala não encontrada")
     sala.status_atual = "LIVRE"
     sala.ocupante_atual = None
+    sala.especialidade_atual = None
     sala.horario_entrada = None
     db.commit()
+    registro_ocupacao.registrar("CHECKOUT", sala, "MANUAL")
     return {"message": "Check-out realizado."}
 
+@app.post("/api/salas/lote")
+def processar_lote_checkin(dados: LoteCheckInRequest, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    """
+    Aplica vários check-ins/checkouts numa única transação (recepção, sincronização de totens).
+    CHECKIN/CHECKOUT são aplicados na ordem enviada; os CHECKIN_INTELIGENTE são distribuídos
+    juntos no final, entre as salas que sobraram livres.
+    """
+    from app.core.optimizer import atribuir_checkins_conjuntos
+
+    operacoes = dados.operacoes
+    resultados = [None] * len(operacoes)
+    eventos = []
+    agora_str = datetime.now().strftime("%H:%M")
+
+    def falha(i, tipo, motivo):
+        resultados[i] = {"indice": i, "tipo": tipo, "status": "ERRO", "detail": motivo}
+
+    ids = {op.sala_id for op in operacoes if op.sala_id}
+    salas = {s.id: s for s in db.query(Sala).filter(Sala.unidade == unidade, Sala.id.in_(ids))} if ids else {}
+
+    inteligentes = []
+    for i, op in enumerate(operacoes):
+        tipo = op.tipo.upper().strip()
+        if tipo == "CHECKIN_INTELIGENTE":
+            if not op.medico_nome or not op.especialidade:
+                falha(i, tipo, "medico_nome e especialidade são obrigatórios")
+            else:
+                inteligentes.append(i)
+            continue
+        if tipo not in ("CHECKIN", "CHECKOUT"):
+            falha(i, tipo, f"Tipo de operação inválido: {op.tipo}")
+            continue
+
+        sala = salas.get(op.sala_id)
+        if not sala:
+            falha(i, tipo, "Sala não encontrada")
+            continue
+
+        if tipo == "CHECKIN":
+            if not op.medico_nome:
+                falha(i, tipo, "medico_nome é obrigatório")
+                continue
+            sala.status_atual = "OCUPADA"
+            sala.ocupante_atual = op.medico_nome
+            sala.horario_entrada = agora_str
+            eventos.append(("CHECKIN", sala, "MANUAL", op.medico_nome, None))
+        else:
+            sala.status_atual = "LIVRE"
+            sala.ocupante_atual = None
+            sala.especialidade_atual = None
+            sala.horario_entrada = None
+            eventos.append(("CHECKOUT", sala, "MANUAL", None, None))
+        resultados[i] = {"indice": i, "tipo": tipo, "status": "OK", "sala_id": sala.id}
+
+    if inteligentes:
+        db.flush() # As salas ocupadas acima já não aparecem como livres
+        salas_disponiveis = db.query(Sala).filter(
+            Sala.unidade == unidade, Sala.status_atual == "LIVRE", Sala.is_maintenance == False
+        ).all()
+        especialidades = [operacoes[i].especialidade for i in inteligentes]
+        escolhas = atribuir_checkins_conjuntos(db, especialidades, salas_disponiveis, unidade)
+
+        for i, sala in zip(inteligentes, escolhas):
+            op = operacoes[i]
+            if sala is None:
+                falha(i, "CHECKIN_INTELIGENTE", "Não há nenhuma sala livre.")
+                continue
+            sala.status_atual = "OCUPADA"
+            sala.ocupante_atual = op.medico_nome
+            sala.horario_entrada = agora_str
+            eventos.append(("CHECKIN", sala, "INTELIGENTE", op.medico_nome, op.especialidade.upper().strip()))
+            resultados[i] = {"indice": i, "tipo": "CHECKIN_INTELIGENTE", "status": "OK", "sala_id": sala.id}
+
+    db.commit()
+    for evento in eventos:
+        registro_ocupacao.registrar(*evento)
+
+    sucesso = sum(1 for r in resultados if r["status"] == "OK")
+    return {
+        "total": len(operacoes),
+        "sucesso": sucesso,
+        "falhas": len(operacoes) - sucesso,
+        "resultados": resultados,
+    }
+
 @app.get("/api/salas")
-def listar_salas(db: Session = Depends(get_db)):
-    return db.query(Sala).all()
+def listar_salas(db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    return db.query(Sala).filter(Sala.unidade == unidade).all()
 
 @app.get("/api/salas/ociosas")
-def listar_salas_ociosas(db: Session = Depends(get_db)):
-    salas_livres = db.query(Sala).filter(Sala.status_atual == "LIVRE", Sala.is_maintenance == False).all()
+def listar_salas_ociosas(db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    salas_livres = db.query(Sala).filter(
+        Sala.unidade == unidade, Sala.status_atual == "LIVRE", Sala.is_maintenance == False
+    ).all()
     return {"total_livres": len(salas_livres), "salas": salas_livres}
 
 @app.get("/api/grades")
-def listar_demanda(db: Session = Depends(get_db)):
-    return db.query(Grade).all()
+def listar_demanda(db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    return db.query(Grade).filter(Grade.unidade == unidade).all()
 
 @app.get("/api/alocacoes")
-def listar_alocacoes_finais(db: Session = Depends(get_db)):
-    return db.query(Alocacao).all()
+def listar_alocacoes_finais(db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    return db.query(Alocacao).filter(Alocacao.unidade == unidade).all()
 
 @app.get("/api/mapa-especialidades")
-def listar_especialidades_das_salas(db: Session = Depends(get_db)):
-    dados = db.query(Sala.id, Sala.especialidade_preferencial).all()
-    mapa = defaultdict(list)
-    for sala_id, especialidade in dados:
-        chave = especialidade.strip() if especialidade and especialidade.strip() else "SEM_PREFERENCIA"
-        mapa[chave].append(sala_id)
-    return dict(sorted(mapa.items()))
+def listar_especialidades_das_salas(db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    return cache_salas.mapa_especialidades(db, unidade)
 
 @app.get("/api/alocacao/resumo")
-def ler_alocacao_existente(db: Session = Depends(get_db)):
+def ler_alocacao_existente(db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    from app.core.optimizer import obter_resumo_atual
+
     # Se vazio, gera. Se não, apenas lê.
-    if db.query(Alocacao).count() == 0:
-        return trigger_alocacao_inteligente(db=db)
+    if db.query(Alocacao).filter(Alocacao.unidade == unidade).count() == 0:
+        return trigger_alocacao_inteligente(db=db, unidade=unidade)
     
-    resultado = obter_resumo_atual(db)
+    resultado = obter_resumo_atual(db, unidade)
     
     try:
-        qtd_ocupadas, dia_usado, turno_usado = sincronizar_status_com_alocacao(db)
+        qtd_ocupadas, dia_usado, turno_usado = sincronizar_status_com_alocacao(db, unidade=unidade)
     except:
         qtd_ocupadas, dia_usado, turno_usado = (0, "N/A", "N/A")
         
+    resultado["unidade"] = unidade
     resultado["modo"] = "PERSISTIDO"
     resultado["contexto_usado"] = f"{dia_usado} - {turno_usado}"
     resultado["salas_ocupadas_agora"] = qtd_ocupadas
-    return resultado
\ No newline at end of file
+    return resultado
+
+@app.get("/api/analytics/ocupacao")
+def analytics_ocupacao(inicio: date = None, fim: date = None, agrupar: str = "sala", db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    resultado = resumo_ocupacao(db, unidade, inicio, fim, agrupar)
+    if "erro" in resultado: raise HTTPException(status_code=400, detail=resultado["erro"])
+    return resultado
+
+@app.get("/api/capacidade")
+def relatorio_capacidade(dia: str = None, turno: str = None, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    from app.core.capacidade import analisar_capacidade
+    return analisar_capacidade(db, unidade, dia.upper() if dia else None, turno.upper() if turno else None)
+
+@app.post("/api/snapshot/exportar")
+def exportar_plano(nome: str, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    from app.services.snapshot import exportar_snapshot, caminho_snapshot
+    try:
+        return exportar_snapshot(db, caminho_snapshot(nome), unidade)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/snapshot/importar")
+def importar_plano(nome: str, db: Session = Depends(get_db), unidade: str = Depends(get_unidade)):
+    from app.services.snapshot import importar_snapshot, caminho_snapshot
+    try:
+        return importar_snapshot(db, caminho_snapshot(nome), unidade)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
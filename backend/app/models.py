@@ -1,9 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, JSON, ForeignKey
-from app.database import Base
+from sqlalchemy import Column, Integer, Float, String, Boolean, JSON, DateTime, ForeignKey, ForeignKeyConstraint, UniqueConstraint, Index
+from app.database import Base, UNIDADE_PADRAO
 
 class Sala(Base):
     __tablename__ = "salas"
 
+    # Ids como "E0-01" só são únicos dentro de uma unidade hospitalar
+    unidade = Column(String, primary_key=True, default=UNIDADE_PADRAO)
     id = Column(String, primary_key=True, index=True) 
     nome_visual = Column(String)
     bloco = Column(String)
@@ -25,6 +27,7 @@ class Grade(Base):
     __tablename__ = "grades"
 
     id = Column(Integer, primary_key=True, index=True)
+    unidade = Column(String, index=True, default=UNIDADE_PADRAO)
     nome_profissional = Column(String)
     especialidade = Column(String)
     tipo_recurso = Column(String) # "DOCENTE", "RESIDENTE", "EXTRA"
@@ -35,13 +38,64 @@ class Grade(Base):
 
 class Alocacao(Base):
     __tablename__ = "alocacoes"
+    __table_args__ = (
+        ForeignKeyConstraint(["unidade", "sala_id"], ["salas.unidade", "salas.id"]),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    unidade = Column(String, index=True, default=UNIDADE_PADRAO)
     
-    sala_id = Column(String, ForeignKey("salas.id"))
+    sala_id = Column(String)
     grade_id = Column(Integer, ForeignKey("grades.id"))
     
     # Redundância para facilitar consultas rápidas
     dia_semana = Column(String)
     turno = Column(String)
-    score = Column(Integer) # Para o algoritmo saber quão boa foi essa escolha
\ No newline at end of file
+    score = Column(Integer) # Para o algoritmo saber quão boa foi essa escolha
+    score_detalhado = Column(JSON, nullable=True) # Regras que compuseram o score (auditoria)
+
+class EventoOcupacao(Base):
+    """Histórico append-only de entradas/saídas das salas."""
+    __tablename__ = "eventos_ocupacao"
+    __table_args__ = (Index("ix_evento_sala", "unidade", "sala_id", "id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    unidade = Column(String, default=UNIDADE_PADRAO)
+    sala_id = Column(String)
+    bloco = Column(String)
+
+    tipo = Column(String) # "CHECKIN" ou "CHECKOUT"
+    origem = Column(String) # "MANUAL", "INTELIGENTE" ou "ALOCACAO" (sincronização automática)
+    ocupante = Column(String, nullable=True)
+    especialidade = Column(String, nullable=True)
+    momento = Column(DateTime, index=True)
+
+class VersaoSalas(Base):
+    """Contador por unidade, incrementado a cada reimportação de salas (invalida caches em outros processos)."""
+    __tablename__ = "versao_salas"
+
+    unidade = Column(String, primary_key=True)
+    versao = Column(Integer, default=0)
+
+class OcupacaoHora(Base):
+    """Rollup incremental: minutos ocupados por sala/especialidade em cada hora."""
+    __tablename__ = "ocupacao_hora"
+    __table_args__ = (
+        UniqueConstraint("unidade", "data", "hora", "sala_id", "especialidade", "origem"),
+        Index("ix_ocupacao_periodo", "unidade", "data"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    unidade = Column(String, default=UNIDADE_PADRAO)
+    data = Column(String) # ISO "AAAA-MM-DD"
+    hora = Column(Integer)
+    dia_semana = Column(String)
+    turno = Column(String)
+
+    sala_id = Column(String)
+    bloco = Column(String)
+    especialidade = Column(String, nullable=True)
+    origem = Column(String)
+
+    minutos = Column(Float, default=0.0)
+    entradas = Column(Integer, default=0) # Quantidade de check-ins iniciados nesta hora
@@ -1,18 +1,26 @@
-import pandas as pd
 import os
 import re
 import unicodedata
 from app.models import Sala, Grade
-from app.database import SessionLocal
+from app.database import SessionLocal, UNIDADE_PADRAO, normalizar_unidade
+from app.core.cache import cache_salas
 from collections import defaultdict
 
-def get_file_path(filename):
+def get_file_path(filename, unidade=UNIDADE_PADRAO):
+    unidade = normalizar_unidade(unidade)
+    # Cada unidade pode ter sua pasta (data/<unidade>/); a raiz de data/ é da unidade padrão
     possible_paths = [
-        f"data/{filename}", 
-        f"backend/data/{filename}", 
-        f"../data/{filename}",
-        filename
+        f"data/{unidade}/{filename}",
+        f"backend/data/{unidade}/{filename}",
+        f"../data/{unidade}/{filename}",
     ]
+    if unidade == UNIDADE_PADRAO:
+        possible_paths += [
+            f"data/{filename}", 
+            f"backend/data/{filename}", 
+            f"../data/{filename}",
+            filename
+        ]
     for path in possible_paths:
         if os.path.exists(path): return path
     return None
@@ -121,11 +129,15 @@ def extrair_bloco_e_andar(pavimento_raw):
     
     return bloco, andar
 
-def importar_salas_csv():
+def importar_salas_csv(unidade=UNIDADE_PADRAO):
+    try: unidade = normalizar_unidade(unidade)
+    except ValueError as e: return {"erro": str(e)}
     filename = "salas.csv"
-    csv_path = get_file_path(filename)
+    csv_path = get_file_path(filename, unidade)
     if not csv_path: return {"erro": f"Arquivo '{filename}' não encontrado."}
 
+    # pandas só é carregado quando há importação (o worker de check-in não precisa dele)
+    import pandas as pd
     try: 
         # Lê tudo como string
         df = pd.read_csv(csv_path, dtype=str)
@@ -133,7 +145,7 @@ def importar_salas_csv():
 
     db = SessionLocal()
     try:
-        db.query(Sala).delete()
+        db.query(Sala).filter(Sala.unidade == unidade).delete()
         salas_criadas = 0
         room_counters = defaultdict(int)
         
@@ -178,14 +190,16 @@ def importar_salas_csv():
                 sala_id = f"{bloco}{andar}-{room_counters[(bloco, andar)]:02d}"
                 
                 nova_sala = Sala(
-                    id=sala_id, nome_visual=sala_id, bloco=bloco, andar=andar,
+                    unidade=unidade, id=sala_id, nome_visual=sala_id, bloco=bloco, andar=andar,
                     especialidade_preferencial=nome_clean, features=features, is_maintenance=is_obra
                 )
                 db.add(nova_sala)
                 salas_criadas += 1
         
+        cache_salas.marcar_alteracao(db, unidade)
         db.commit()
-        return {"status": "sucesso", "salas_importadas": salas_criadas}
+        cache_salas.invalidar(unidade)
+        return {"status": "sucesso", "unidade": unidade, "salas_importadas": salas_criadas}
     except Exception as e:
         db.rollback()
         return {"erro": f"Erro crítico salas: {str(e)}"}
@@ -203,12 +217,15 @@ def map_dia_semana(valor):
     except: pass
     return "IND"
 
-def importar_grades_csv():
+def importar_grades_csv(unidade=UNIDADE_PADRAO):
+    try: unidade = normalizar_unidade(unidade)
+    except ValueError as e: return {"erro": str(e)}
     filename = "Grades 2.csv"
-    path = get_file_path(filename)
-    if not path: path = get_file_path("grades.csv")
+    path = get_file_path(filename, unidade)
+    if not path: path = get_file_path("grades.csv", unidade)
     if not path: return {"erro": "Arquivo de grades não encontrado"}
     
+    import pandas as pd
     try: 
         df = pd.read_csv(path)
         # Remove duplicatas exatas
@@ -217,7 +234,7 @@ def importar_grades_csv():
 
     db = SessionLocal()
     try:
-        db.query(Grade).delete()
+        db.query(Grade).filter(Grade.unidade == unidade).delete()
         grades_criadas = 0
         for _, row in df.iterrows():
             raw_spec = str(row.get('nome_especialidade', ''))
@@ -237,6 +254,7 @@ def importar_grades_csv():
             tipo = "RESIDENTE" if "RESIDENTE" in vinculo else "DOCENTE"
 
             nova_grade = Grade(
+                unidade=unidade,
                 nome_profissional=str(row.get('nome', 'Profissional')),
                 especialidade=especialidade_mapeada,
                 tipo_recurso=tipo, dia_semana=dia, turno=turno, origem="Grades2"
@@ -244,7 +262,7 @@ def importar_grades_csv():
             db.add(nova_grade)
             grades_criadas += 1
         db.commit()
-        return {"status": "sucesso", "grades_importadas": grades_criadas}
+        return {"status": "sucesso", "unidade": unidade, "grades_importadas": grades_criadas}
     except Exception as e:
         db.rollback()
         return {"erro": str(e)}
@@ -0,0 +1,227 @@
+import threading
+from collections import deque, defaultdict
+from datetime import datetime, timedelta, date
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models import Sala, Alocacao, EventoOcupacao, OcupacaoHora
+from app.database import SessionLocal, UNIDADE_PADRAO
+from app.core.time import DIAS_MAP, HORAS_TURNO, turno_da_hora
+
+ORIGENS_PLANEJADAS = ("ALOCACAO",)
+
+def fatias_por_hora(inicio: datetime, fim: datetime):
+    """Quebra o intervalo [inicio, fim) em pedaços que não cruzam a virada da hora."""
+    cursor = inicio
+    while cursor < fim:
+        proxima_hora = cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        ate = min(proxima_hora, fim)
+        yield cursor, (ate - cursor).total_seconds() / 60
+        cursor = ate
+
+class RegistroOcupacao:
+    """
+    Fila em memória de eventos de check-in/checkout. As rotas só enfileiram;
+    uma thread de fundo grava os eventos em lote e atualiza os rollups por hora
+    na mesma transação.
+
+    A sessão aberta de cada sala vem sempre do último evento gravado no banco, e não de
+    estado do processo: com vários workers, cada um enfileira só parte dos eventos.
+    """
+
+    def __init__(self, session_factory=SessionLocal, intervalo: float = 2.0, lote_max: int = 500):
+        self.session_factory = session_factory
+        self.intervalo = intervalo
+        self.lote_max = lote_max
+        self._fila = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def registrar(self, tipo: str, sala: Sala, origem: str, ocupante: str = None, especialidade: str = None, momento: datetime = None):
+        self._fila.append({
+            "unidade": sala.unidade or UNIDADE_PADRAO,
+            "sala_id": sala.id,
+            "bloco": sala.bloco,
+            "tipo": tipo,
+            "origem": origem,
+            "ocupante": ocupante,
+            # Check-in manual não informa especialidade: fica None em vez de herdar a da sala
+            "especialidade": especialidade,
+            "momento": momento or datetime.now(),
+        })
+        self._iniciar()
+        if len(self._fila) >= self.lote_max:
+            with self._cond: self._cond.notify()
+
+    def _iniciar(self):
+        if self._thread is not None: return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="registro-ocupacao", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.intervalo)
+            self.descarregar()
+
+    def descarregar(self) -> int:
+        """Grava tudo que está na fila. Retorna quantos eventos foram persistidos."""
+        with self._flush_lock:
+            lote = []
+            while self._fila:
+                lote.append(self._fila.popleft())
+            if not lote: return 0
+
+            db = self.session_factory()
+            try:
+                # (unidade, sala_id) -> último CHECKIN do lote, ou None se a sala foi liberada
+                rollups, sessoes = {}, {}
+                for evento in lote:
+                    self._aplicar(db, evento, rollups, sessoes)
+                    db.add(EventoOcupacao(**evento))
+                db.commit()
+                return len(lote)
+            except Exception as e:
+                db.rollback()
+                # Devolve o lote ao início da fila, na ordem original, para a próxima tentativa
+                self._fila.extendleft(reversed(lote))
+                print(f" [OCUPACAO] Falha ao gravar {len(lote)} eventos (nova tentativa no próximo ciclo): {e}")
+                return 0
+            finally:
+                db.close()
+
+    # --- Rollups incrementais ---
+    def _sessao_aberta(self, db: Session, chave, sessoes: dict):
+        if chave in sessoes: return sessoes[chave]
+        # Primeiro evento da sala no lote: o estado vale o que está gravado (por qualquer processo)
+        ultimo = db.query(EventoOcupacao).filter(
+            EventoOcupacao.unidade == chave[0], EventoOcupacao.sala_id == chave[1]
+        ).order_by(EventoOcupacao.id.desc()).first()
+        if ultimo and ultimo.tipo == "CHECKIN":
+            return {c: getattr(ultimo, c) for c in ("unidade", "sala_id", "bloco", "origem", "especialidade", "momento")}
+        return None
+
+    def _aplicar(self, db: Session, evento: dict, rollups: dict, sessoes: dict):
+        chave = (evento["unidade"], evento["sala_id"])
+        # Um CHECKIN em sala já ocupada encerra a sessão anterior no mesmo instante
+        aberta = self._sessao_aberta(db, chave, sessoes)
+        if aberta:
+            for inicio, minutos in fatias_por_hora(aberta["momento"], evento["momento"]):
+                self._linha(db, rollups, aberta, inicio).minutos += minutos
+
+        if evento["tipo"] == "CHECKIN":
+            sessoes[chave] = evento
+            self._linha(db, rollups, evento, evento["momento"]).entradas += 1
+        else:
+            sessoes[chave] = None
+
+    def _linha(self, db: Session, rollups: dict, sessao: dict, momento: datetime) -> OcupacaoHora:
+        chave = {
+            "unidade": sessao["unidade"],
+            "data": momento.date().isoformat(),
+            "hora": momento.hour,
+            "sala_id": sessao["sala_id"],
+            "especialidade": sessao["especialidade"],
+            "origem": sessao["origem"],
+        }
+        k = tuple(chave.values())
+        linha = rollups.get(k)
+        if linha is None:
+            linha = db.query(OcupacaoHora).filter_by(**chave).first()
+            if linha is None:
+                linha = OcupacaoHora(
+                    **chave, bloco=sessao["bloco"], dia_semana=DIAS_MAP[momento.weekday()],
+                    turno=turno_da_hora(momento.hour), minutos=0.0, entradas=0
+                )
+                db.add(linha)
+            rollups[k] = linha
+        return linha
+
+registro_ocupacao = RegistroOcupacao()
+
+def salas_com_checkin_registrado(db: Session, unidade: str = UNIDADE_PADRAO) -> set:
+    """Salas cujo último evento gravado é um CHECKIN (estado segundo o histórico, não status_atual)."""
+    ultimos = db.query(func.max(EventoOcupacao.id)).filter(EventoOcupacao.unidade == unidade) \
+        .group_by(EventoOcupacao.sala_id)
+    return {
+        sala_id for sala_id, in db.query(EventoOcupacao.sala_id)
+        .filter(EventoOcupacao.id.in_(ultimos), EventoOcupacao.tipo == "CHECKIN")
+    }
+
+# --- Consultas analíticas (somente sobre os rollups) ---
+AGRUPAMENTOS = {"sala": OcupacaoHora.sala_id, "especialidade": OcupacaoHora.especialidade, "bloco": OcupacaoHora.bloco}
+
+def resumo_ocupacao(db: Session, unidade: str = UNIDADE_PADRAO, inicio: date = None, fim: date = None, agrupar: str = "sala"):
+    if agrupar not in AGRUPAMENTOS:
+        return {"erro": f"Agrupamento inválido: {agrupar}. Use {', '.join(AGRUPAMENTOS)}"}
+    registro_ocupacao.descarregar()
+
+    fim = fim or date.today()
+    inicio = inicio or fim - timedelta(days=6)
+    dias = (fim - inicio).days + 1
+
+    periodo = (
+        OcupacaoHora.unidade == unidade,
+        OcupacaoHora.data >= inicio.isoformat(),
+        OcupacaoHora.data <= fim.isoformat(),
+    )
+    coluna = AGRUPAMENTOS[agrupar]
+
+    def agregar(campo):
+        return db.query(coluna, campo, func.sum(OcupacaoHora.minutos), func.sum(OcupacaoHora.entradas)) \
+            .filter(*periodo).group_by(coluna, campo).all()
+
+    # Capacidade física (salas ativas) para converter minutos em taxa de utilização
+    capacidade = defaultdict(int)
+    if agrupar != "especialidade":
+        for sala in db.query(Sala).filter(Sala.unidade == unidade, Sala.is_maintenance == False):
+            capacidade[sala.id if agrupar == "sala" else sala.bloco] += 1
+
+    def formatar(linhas, campo, minutos_disponiveis):
+        saida = []
+        for grupo, valor, minutos, entradas in sorted(linhas, key=lambda x: (str(x[0]), x[1])):
+            disponivel = minutos_disponiveis(valor) * capacidade.get(grupo, 0) * dias
+            saida.append({
+                agrupar: grupo, campo: valor,
+                "minutos_ocupados": round(minutos or 0, 1),
+                "entradas": entradas or 0,
+                "taxa_utilizacao": round((minutos or 0) / disponivel, 4) if disponivel else None,
+            })
+        return saida
+
+    ocupadas_turno = defaultdict(set)
+    for data_str, turno, sala_id in db.query(OcupacaoHora.data, OcupacaoHora.turno, OcupacaoHora.sala_id) \
+            .filter(*periodo, OcupacaoHora.origem.notin_(ORIGENS_PLANEJADAS)).distinct():
+        ocupadas_turno[(data_str, turno)].add(sala_id)
+
+    # Planejado x realizado: salas alocadas no turno vs salas com check-in real
+    planejadas = defaultdict(set)
+    for sala_id, dia_semana, turno in db.query(Alocacao.sala_id, Alocacao.dia_semana, Alocacao.turno).filter(Alocacao.unidade == unidade):
+        planejadas[(dia_semana, turno)].add(sala_id)
+
+    planejado_vs_realizado = []
+    for n in range(dias):
+        dia = inicio + timedelta(days=n)
+        dia_semana = DIAS_MAP[dia.weekday()]
+        for turno in HORAS_TURNO:
+            plano = planejadas.get((dia_semana, turno), set())
+            real = ocupadas_turno.get((dia.isoformat(), turno), set())
+            if not plano and not real: continue
+            planejado_vs_realizado.append({
+                "data": dia.isoformat(), "dia_semana": dia_semana, "turno": turno,
+                "planejadas": len(plano),
+                "realizadas": len(plano & real),
+                "nao_planejadas": len(real - plano),
+                "aderencia": round(len(plano & real) / len(plano), 4) if plano else None,
+            })
+
+    return {
+        "unidade": unidade,
+        "periodo": {"inicio": inicio.isoformat(), "fim": fim.isoformat()},
+        "agrupamento": agrupar,
+        "por_hora": formatar(agregar(OcupacaoHora.hora), "hora", lambda _: 60),
+        "por_turno": formatar(agregar(OcupacaoHora.turno), "turno", lambda t: HORAS_TURNO.get(t, 0) * 60),
+        "planejado_vs_realizado": planejado_vs_realizado,
+    }
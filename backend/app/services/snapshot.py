@@ -0,0 +1,170 @@
+"""
+Snapshot binário do plano semanal (salas, grades e alocações) em Arrow IPC.
+
+Cada snapshot é uma pasta com um arquivo .arrow por tabela, sem compressão, para
+poder ser lido via memory-map. Textos repetidos (especialidade, bloco, dia, turno,
+códigos de sala) são gravados com dictionary encoding.
+
+Uso pela linha de comando (dentro de backend/):
+    python -m app.services.snapshot exportar <pasta> [--unidade HC]
+    python -m app.services.snapshot importar <pasta> [--unidade HC]
+"""
+import os, re
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.models import Sala, Grade, Alocacao
+from app.database import UNIDADE_PADRAO
+from app.core.cache import cache_salas
+from app.core.optimizer import lock_da_unidade
+
+VERSAO_SNAPSHOT = "1"
+TABELAS = ("salas", "grades", "alocacoes")
+
+# Pasta base para snapshots criados/lidos pela API (a CLI aceita qualquer caminho)
+SNAPSHOT_DIR = os.environ.get("GDS_SNAPSHOT_DIR", "snapshots")
+
+def caminho_snapshot(nome: str) -> str:
+    if not re.fullmatch(r"[\w.-]+", nome or "") or nome.startswith("."):
+        raise ValueError(f"Nome de snapshot inválido: '{nome}'")
+    return os.path.join(SNAPSHOT_DIR, nome)
+
+def _schemas():
+    # pyarrow só é carregado quando um snapshot é usado
+    import pyarrow as pa
+    texto_dict = pa.dictionary(pa.int32(), pa.string())
+    return {
+        "salas": pa.schema([
+            ("id", texto_dict), ("nome_visual", pa.string()),
+            ("bloco", texto_dict), ("andar", texto_dict),
+            ("especialidade_preferencial", texto_dict),
+            ("features", pa.list_(pa.string())), ("is_maintenance", pa.bool_()),
+        ]),
+        "grades": pa.schema([
+            ("id", pa.int64()), ("nome_profissional", pa.string()),
+            ("especialidade", texto_dict), ("tipo_recurso", texto_dict),
+            ("dia_semana", texto_dict), ("turno", texto_dict), ("origem", texto_dict),
+        ]),
+        "alocacoes": pa.schema([
+            ("sala_id", texto_dict), ("grade_id", pa.int64()),
+            ("dia_semana", texto_dict), ("turno", texto_dict), ("score", pa.int64()),
+            ("score_detalhado", pa.list_(pa.struct([("regra", texto_dict), ("pontos", pa.int64())]))),
+        ]),
+    }
+
+def _linhas(db: Session, unidade: str):
+    salas = db.query(
+        Sala.id, Sala.nome_visual, Sala.bloco, Sala.andar,
+        Sala.especialidade_preferencial, Sala.features, Sala.is_maintenance
+    ).filter(Sala.unidade == unidade).order_by(Sala.id).all()
+    grades = db.query(
+        Grade.id, Grade.nome_profissional, Grade.especialidade, Grade.tipo_recurso,
+        Grade.dia_semana, Grade.turno, Grade.origem
+    ).filter(Grade.unidade == unidade).order_by(Grade.id).all()
+    alocacoes = db.query(
+        Alocacao.sala_id, Alocacao.grade_id, Alocacao.dia_semana, Alocacao.turno,
+        Alocacao.score, Alocacao.score_detalhado
+    ).filter(Alocacao.unidade == unidade).order_by(Alocacao.id).all()
+    return {"salas": salas, "grades": grades, "alocacoes": alocacoes}
+
+def exportar_snapshot(db: Session, destino: str, unidade: str = UNIDADE_PADRAO) -> dict:
+    import pyarrow as pa
+
+    os.makedirs(destino, exist_ok=True)
+    metadados = {
+        "gds_versao": VERSAO_SNAPSHOT, "unidade": unidade,
+        "criado_em": datetime.now().isoformat(timespec="seconds"),
+    }
+    totais = {}
+    for tabela, linhas in _linhas(db, unidade).items():
+        schema = _schemas()[tabela]
+        colunas = {nome: [getattr(l, nome) for l in linhas] for nome in schema.names}
+        if tabela == "salas":
+            colunas["features"] = [f if isinstance(f, list) else [] for f in colunas["features"]]
+        tabela_arrow = pa.Table.from_pydict(colunas, schema=schema.with_metadata(metadados))
+
+        caminho = os.path.join(destino, f"{tabela}.arrow")
+        with pa.OSFile(caminho, "wb") as arquivo, pa.ipc.new_file(arquivo, tabela_arrow.schema) as writer:
+            writer.write_table(tabela_arrow)
+        totais[tabela] = tabela_arrow.num_rows
+
+    return {"status": "sucesso", "unidade": unidade, "destino": destino, **totais}
+
+def ler_snapshot(origem: str) -> dict:
+    """Abre as tabelas via memory-map (sem copiar para a memória). Retorna {nome: pyarrow.Table}."""
+    import pyarrow as pa
+
+    tabelas = {}
+    for tabela in TABELAS:
+        caminho = os.path.join(origem, f"{tabela}.arrow")
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"Snapshot incompleto: '{caminho}' não encontrado")
+        tabelas[tabela] = pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all()
+
+        versao = (tabelas[tabela].schema.metadata or {}).get(b"gds_versao", b"").decode()
+        if versao != VERSAO_SNAPSHOT:
+            raise ValueError(f"Versão de snapshot não suportada em '{caminho}': {versao or 'desconhecida'}")
+    return tabelas
+
+def importar_snapshot(db: Session, origem: str, unidade: str = UNIDADE_PADRAO) -> dict:
+    """Substitui salas, grades e alocações da unidade pelo conteúdo do snapshot."""
+    tabelas = ler_snapshot(origem)
+    salas = tabelas["salas"].to_pylist()
+    grades = tabelas["grades"].to_pylist()
+    alocacoes = tabelas["alocacoes"].to_pylist()
+
+    with lock_da_unidade(unidade):
+        try:
+            db.query(Alocacao).filter(Alocacao.unidade == unidade).delete()
+            db.query(Grade).filter(Grade.unidade == unidade).delete()
+            db.query(Sala).filter(Sala.unidade == unidade).delete()
+
+            if salas:
+                db.execute(insert(Sala), [{**s, "unidade": unidade, "status_atual": "LIVRE"} for s in salas])
+
+            # Ids de grade são globais no banco: gera novos e remapeia as alocações
+            mapa_grades = {}
+            if grades:
+                novos_ids = db.execute(
+                    insert(Grade).returning(Grade.id, sort_by_parameter_order=True),
+                    [{k: v for k, v in g.items() if k != "id"} | {"unidade": unidade} for g in grades]
+                ).scalars().all()
+                mapa_grades = {g["id"]: novo for g, novo in zip(grades, novos_ids)}
+
+            linhas_alocacao = [
+                {**a, "grade_id": mapa_grades[a["grade_id"]], "unidade": unidade}
+                for a in alocacoes if a["grade_id"] in mapa_grades
+            ]
+            if linhas_alocacao:
+                db.execute(insert(Alocacao), linhas_alocacao)
+            cache_salas.marcar_alteracao(db, unidade)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cache_salas.invalidar(unidade)
+
+    return {
+        "status": "sucesso", "unidade": unidade, "origem": origem,
+        "salas": len(salas), "grades": len(grades), "alocacoes": len(linhas_alocacao),
+    }
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import SessionLocal, init_db, normalizar_unidade
+
+    parser = argparse.ArgumentParser(description="Exporta/importa o plano semanal em Arrow IPC.")
+    parser.add_argument("acao", choices=["exportar", "importar"])
+    parser.add_argument("pasta")
+    parser.add_argument("--unidade", default=UNIDADE_PADRAO)
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        unidade = normalizar_unidade(args.unidade)
+        if args.acao == "exportar": print(exportar_snapshot(db, args.pasta, unidade))
+        else: print(importar_snapshot(db, args.pasta, unidade))
+    finally:
+        db.close()
@@ -0,0 +1,48 @@
+"""
+Benchmark do otimizador sobre um plano fixo (snapshot Arrow IPC).
+
+Uso (dentro de backend/):
+    python -m app.services.snapshot exportar benchmarks/dados/semana   # uma vez, a partir do banco atual
+    python benchmarks/alocacao.py benchmarks/dados/semana [--rodadas 5]
+
+Carrega o snapshot num SQLite em memória, então o resultado não depende do
+gds_poc.db local nem de reimportar os CSVs.
+"""
+import argparse, os, statistics, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.services.snapshot import importar_snapshot
+from app.core.optimizer import gerar_alocacao_grade
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("snapshot")
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--unidade", default="BENCH")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    inicio = time.perf_counter()
+    carga = importar_snapshot(db, args.snapshot, args.unidade)
+    print(f"carga do snapshot      : {time.perf_counter() - inicio:.3f}s ({carga['salas']} salas, {carga['grades']} grades)")
+
+    tempos = []
+    for _ in range(args.rodadas):
+        inicio = time.perf_counter()
+        resultado = gerar_alocacao_grade(db, args.unidade)
+        tempos.append(time.perf_counter() - inicio)
+
+    print(f"gerar_alocacao_grade   : mediana {statistics.median(tempos):.3f}s (min {min(tempos):.3f}s)")
+    print(f"alocados / conflitos   : {resultado['total_alocados_semana']} / {resultado['total_conflitos']}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark de inicialização: mede o tempo até a API responder a primeira requisição.
+
+Uso (dentro de backend/):
+    python benchmarks/startup.py [--rodadas 5] [--meta 2.0]
+
+Sobe `uvicorn app.main:app` em uma porta livre, faz polling em GET / e encerra o
+processo. Sai com código 1 se a mediana passar da meta (em segundos).
+"""
+import argparse, os, socket, statistics, subprocess, sys, time
+import urllib.request
+
+META_PRIMEIRA_REQUISICAO = 2.0 # segundos
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def medir_import() -> float:
+    # Processo novo para não reaproveitar módulos já carregados
+    codigo = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    saida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True)
+    return float(saida.stdout.strip().splitlines()[-1])
+
+def medir_primeira_requisicao(timeout: float = 30.0) -> float:
+    porta = porta_livre()
+    url = f"http://127.0.0.1:{porta}/"
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(porta), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - inicio < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as resp:
+                    if resp.status == 200: return time.perf_counter() - inicio
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"API não respondeu em {timeout}s")
+    finally:
+        processo.terminate()
+        processo.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--meta", type=float, default=META_PRIMEIRA_REQUISICAO)
+    args = parser.parse_args()
+
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+    imports = [medir_import() for _ in range(args.rodadas)]
+    primeiras = [medir_primeira_requisicao() for _ in range(args.rodadas)]
+
+    mediana = statistics.median(primeiras)
+    print(f"import app.main        : mediana {statistics.median(imports):.3f}s (min {min(imports):.3f}s)")
+    print(f"primeira requisição    : mediana {mediana:.3f}s (min {min(primeiras):.3f}s)")
+    print(f"meta                   : {args.meta:.3f}s -> {'OK' if mediana <= args.meta else 'ACIMA DA META'}")
+    sys.exit(0 if mediana <= args.meta else 1)
+
+if __name__ == "__main__":
+    main()